@@ -1,11 +1,18 @@
+import asyncio
+import functools
+import json
 import subprocess
-import requests
+import httpx
 import os
+import re
+import runpy
 import sys
+import threading
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from requests.exceptions import RequestException
-from typing import List, Optional
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
 
 # Set up logging
 logging.basicConfig(
@@ -13,7 +20,78 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Language for each supported source file extension
+_EXTENSIONS = {
+    '.py': 'Python',
+    '.js': 'JavaScript',
+    '.ts': 'TypeScript',
+    '.java': 'Java',
+    '.cpp': 'C++',
+    '.cs': 'C#',
+    '.go': 'Go'
+}
+
+# Test framework used for each language
+_FRAMEWORKS = {
+    'Python': 'pytest',
+    'JavaScript': 'jest',
+    'TypeScript': 'jest',
+    'Java': 'JUnit',
+    'C++': 'Google Test',
+    'C#': 'NUnit',
+    'Go': 'testing'
+}
+
+# Maps typographic quotes in generated code to their ASCII equivalents
+_QUOTE_TRANS = str.maketrans({'\u201c': '"', '\u201d': '"', '\u2018': "'", '\u2019': "'"})
+
 class TestGenerator:
+    # Delimits the per-file answers in a batched completion
+    _BATCH_TEST_RE = re.compile(r'^###\s*TEST\s+(\d+)\b.*$', re.MULTILINE)
+    # Most files packed into one request; each gets its own max_tokens of output
+    _MAX_BATCH_SIZE = 4
+    # Output token ceilings by model name prefix; batches never request more
+    _MODEL_MAX_OUTPUT_TOKENS = {
+        'o1-mini': 65536,
+        'o1-preview': 32768,
+        'o1': 100000,
+        'gpt-4o-mini': 16384,
+        'gpt-4o': 16384,
+        'gpt-4-turbo': 4096,
+        'gpt-4': 8192,
+        'gpt-3.5-turbo': 4096
+    }
+    # Ceiling assumed for models missing from the table above
+    _DEFAULT_MAX_OUTPUT_TOKENS = 4096
+    # Requests in flight at once, and retries after a 429 rate-limit response
+    _MAX_CONCURRENT_REQUESTS = 8
+    _MAX_RETRIES = 3
+    # Matches Python test module names collected by pytest
+    _TEST_FILE_RE = re.compile(r'^(test_.*|.*_test|test|tests)\.py$')
+    # Name suffixes of test files, which are never used as generation targets
+    _TEST_FILE_SUFFIXES = ('_test.py', '_test.go', '.test.ts', '.test.js')
+    # Directories never searched for test files
+    _SKIP_DIRS = frozenset({'.git', 'node_modules', '__pycache__', 'venv', '.venv'})
+    # Source extensions an import may resolve to, per importing language
+    _EXTS_BY_LANG = {
+        'Python': ('.py',),
+        'JavaScript': ('.js',),
+        'TypeScript': ('.ts', '.js')
+    }
+    # Cheap pre-filter rejecting lines that cannot contain an import
+    _HAS_IMPORT_RE = re.compile(r'\b(?:import|from)\b|require\(')
+    # Captures the module named by a Python import or a CommonJS require
+    _IMPORT_RE = re.compile(
+        r'^(?:from\s+(\S+)\s+import\s+(.*)|import\s+(\S+)|(?:const|let|var)\s+\w+\s*=\s*require\(["\'](.+?)["\']\))'
+    )
+    # Full-line comments and blank lines, dropped from related file excerpts
+    _COMMENT_LINE_RE = re.compile(r'^[ \t]*(?:(?:#|//).*)?(?:\n|$)', re.MULTILINE)
+    # Cap on how much of each related file is embedded in a prompt
+    _RELATED_FILE_MAX_CHARS = 8192
+    _RELATED_FILE_MAX_LINES = 200
+    # Definitions after which no further imports are expected
+    _DEFINITION_PREFIXES = ('def ', 'async def ', 'class ', 'function ', 'export function ', 'export class ')
+
     def __init__(self):
         self.api_key = os.getenv('OPENAI_API_KEY')
         self.model = os.getenv('OPENAI_MODEL', 'o1-preview')
@@ -27,6 +105,37 @@ class TestGenerator:
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY environment variable is not set")
 
+        # Directory listings used to answer existence checks without stat calls
+        self._listdir_cache: Dict[Path, FrozenSet[str]] = {}
+
+        # Languages whose coverage tooling has already been checked this run
+        self._coverage_checked: Set[str] = set()
+
+        # Reuse a single keep-alive HTTP/2 connection across API calls
+        self._http = httpx.Client(http2=True, timeout=60, headers=self._build_headers())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def _warm_up_connection(self):
+        """Open the connection to the OpenAI API ahead of the first real request."""
+        try:
+            self._http.get('https://api.openai.com/v1/models')
+        except Exception as e:
+            logging.debug(f"Connection warm-up failed: {e}")
+
+    def close(self):
+        """Close the underlying HTTP connection pool."""
+        http = getattr(self, '_http', None)
+        if http is not None and not http.is_closed:
+            http.close()
+
     def get_changed_files(self) -> List[str]:
         """Retrieve list of changed files passed as command-line arguments."""
         if len(sys.argv) <= 1:
@@ -35,67 +144,85 @@ class TestGenerator:
 
     def detect_language(self, file_name: str) -> str:
         """Detect programming language based on file extension."""
-        extensions = {
-            '.py': 'Python',
-            '.js': 'JavaScript',
-            '.ts': 'TypeScript',
-            '.java': 'Java',
-            '.cpp': 'C++',
-            '.cs': 'C#',
-            '.go': 'Go'
-        }
-        _, ext = os.path.splitext(file_name)
-        return extensions.get(ext.lower(), 'Unknown')
+        return _EXTENSIONS.get(os.path.splitext(file_name)[1].lower(), 'Unknown')
 
     def get_test_framework(self, language: str) -> str:
         """Get the appropriate test framework based on language."""
-        frameworks = {
-            'Python': 'pytest',
-            'JavaScript': 'jest',
-            'TypeScript': 'jest',
-            'Java': 'JUnit',
-            'C++': 'Google Test',
-            'C#': 'NUnit',
-            'Go': 'testing'
-        }
-        return frameworks.get(language, 'unknown')
+        return _FRAMEWORKS.get(language, 'unknown')
     
+    def _listdir(self, directory: Path) -> FrozenSet[str]:
+        """List a directory once and cache its entry names."""
+        entries = self._listdir_cache.get(directory)
+        if entries is None:
+            try:
+                entries = frozenset(os.listdir(directory))
+            except OSError:
+                entries = frozenset()
+            self._listdir_cache[directory] = entries
+        return entries
+
+    def _path_exists(self, path: str) -> bool:
+        """Check whether a path exists using the cached directory listing."""
+        potential_file = Path(path)
+        return potential_file.name in self._listdir(potential_file.parent)
+
+    def _ends_import_header(self, line: str) -> bool:
+        """Return True once a top-level definition shows that no further imports will follow."""
+        return line.startswith(self._DEFINITION_PREFIXES)
+
+    def _import_tokens(self, match: re.Match) -> List[str]:
+        """Return the module names referred to by a matched import statement."""
+        from_module, from_names, module, required = match.groups()
+        if from_module and not from_module.strip('.'):
+            if from_module != '.':
+                return []  # "from .. import x" names modules outside the working directory
+            # "from . import a, b" imports sibling modules by name
+            names = from_names.strip('()\\ ').split(',')
+            return [name.split()[0] for name in names if name.strip()]
+        return [from_module or module or required]
+
+    def _resolve_import_token(self, token: str, language: str) -> Optional[str]:
+        """Resolve an imported module name to an existing source file."""
+        extensions = self._EXTS_BY_LANG.get(language, ())
+        module_name = token.rstrip(',;')
+        if module_name.startswith('..'):
+            return None  # Parent-relative imports do not resolve from the working directory
+        if module_name.endswith(extensions):
+            return module_name if self._path_exists(module_name) else None
+        # Relative imports are resolved from the working directory
+        if module_name.startswith('./'):
+            module_name = module_name[2:]
+        elif module_name.startswith('.'):
+            module_name = module_name[1:]
+        path = module_name.replace(".", "/")
+        if not path:
+            return None
+        for ext in extensions:
+            potential_file = f"{path}{ext}"
+            if self._path_exists(potential_file):
+                return potential_file
+        return None
+
     def get_related_files(self, language: str, file_name: str) -> List[str]:
         """Identify related files based on import statements or includes."""
         related_files = []
+        seen = set()
         
         try:
             if language in ["Python", "JavaScript", "TypeScript"]:
-                with open(file_name, 'r') as f:
-                    for line in f:
-                        if 'import ' in line or 'from ' in line or 'require(' in line:
-                            parts = line.split()
-                            for part in parts:
-                                # Handle relative imports
-                                if part.startswith('.') and not part.startswith('..'):
-                                    path = part.replace(".", "")
-                                    for ext in ('.py', '.js', '.ts'):
-                                        potential_file = f"{path}{ext}"
-                                        if Path(potential_file).exists():
-                                            related_files.append(potential_file)
-                                            break
-                                elif '.' in part:
-                                    path = part.replace(".", "/")
-                                    for ext in ('.py', '.js', '.ts'):
-                                        potential_file = f"{path}{ext}"
-                                        if Path(potential_file).exists():
-                                            related_files.append(potential_file)
-                                            break
-                                else:
-                                    if part.endswith(('.py', '.js', '.ts')) and Path(part).exists():
-                                        related_files.append(part)
-                                    elif part.isidentifier():
-                                        base_name = part.lower()
-                                        for ext in ('.py', '.js', '.ts'):
-                                            potential_file = f"{base_name}{ext}"
-                                            if Path(potential_file).exists():
-                                                related_files.append(potential_file)
-                                                break
+                for line in Path(file_name).read_text(errors='ignore').splitlines():
+                    if self._ends_import_header(line):
+                        break
+                    if not self._HAS_IMPORT_RE.search(line):
+                        continue
+                    match = self._IMPORT_RE.match(line.strip())
+                    if not match:
+                        continue
+                    for token in self._import_tokens(match):
+                        related_file = self._resolve_import_token(token, language)
+                        if related_file and related_file not in seen:
+                            seen.add(related_file)
+                            related_files.append(related_file)
             elif language == 'C++':
                 # Implement C++ related file detection logic here
                 pass  # Placeholder for C++ implementation
@@ -108,46 +235,38 @@ class TestGenerator:
         
         return related_files
 
+    def _find_test_files(self, directory: Path) -> List[Path]:
+        """Find Python test files under a directory in a single pass."""
+        test_files = []
+        for root, dirs, files in os.walk(directory):
+            # Prune in place so os.walk does not descend into irrelevant trees
+            dirs[:] = [d for d in dirs if d not in self._SKIP_DIRS]
+            for name in files:
+                if self._TEST_FILE_RE.match(name):
+                    test_files.append(Path(root) / name)
+        return test_files
+
     def get_related_test_files(self, language: str, file_name: str) -> List[str]:
         """Identify related test files based on import statements or includes."""
         related_test_files = []
         try:
             if language == "Python":
                 directory = Path(os.path.dirname(os.path.abspath(__file__)))
-                test_files = list(directory.rglob("tests.py")) + \
-                             list(directory.rglob("test.py")) + \
-                             list(directory.rglob("test_*.py")) + \
-                             list(directory.rglob("*_test.py"))
-                for test_file in test_files:
-                    with open(test_file, 'r') as f:
-                        for line in f:
-                            if 'from ' in line:
-                                parts = line.split()
-                                for part in parts:
-                                    if part.startswith('.') and not part.startswith('..'):
-                                        path = part.replace(".", "")
-                                        for ext in ('.py', '.js', '.ts'):
-                                            potential_file = f"{path}{ext}"
-                                            if Path(potential_file).exists() and potential_file in file_name:
-                                                related_test_files.append(str(test_file))
-                                                break
-                                    elif '.' in part:
-                                        path = part.replace(".", "/")
-                                        for ext in ('.py', '.js', '.ts'):
-                                            potential_file = f"{path}{ext}"
-                                            if Path(potential_file).exists() and potential_file in file_name:
-                                                related_test_files.append(str(test_file))
-                                                break
-                                    else:
-                                        if part.endswith(('.py', '.js', '.ts')) and Path(part).exists() and (file_name in part):
-                                            related_test_files.append(str(test_file))
-                                        elif part.isidentifier():
-                                            base_name = part.lower()
-                                            for ext in ('.py', '.js', '.ts', '.js'):
-                                                potential_file = f"{base_name}{ext}"
-                                                if Path(potential_file).exists() and (file_name in potential_file):
-                                                    related_test_files.append(str(test_file))
-                                                    break
+                for test_file in self._find_test_files(directory):
+                    for line in test_file.read_text(errors='ignore').splitlines():
+                        if self._ends_import_header(line):
+                            break
+                        if not self._HAS_IMPORT_RE.search(line):
+                            continue
+                        match = self._IMPORT_RE.match(line.strip())
+                        if not match:
+                            continue
+                        imported_files = [
+                            self._resolve_import_token(token, language) for token in self._import_tokens(match)
+                        ]
+                        if any(imported_file and imported_file in file_name for imported_file in imported_files):
+                            related_test_files.append(str(test_file))
+                            break  # Each test file only needs to be recorded once
             # Implement related test file detection for other languages if needed
 
         except Exception as e:
@@ -163,21 +282,14 @@ class TestGenerator:
 
         try:
             if language == "Python":
-                subprocess.run(
-                    ["coverage", "run", str(test_file)],
-                    check=True
-                )
-                subprocess.run(
-                    ["coverage", "report", "-m", "--omit=*/site-packages/*"],
-                    stdout=open(report_file, "w"),
-                    check=True
-                )
+                self._run_python_coverage(test_file, report_file)
             elif language == "JavaScript":
-                subprocess.run(
-                    ["jest", "--coverage", "--config=path/to/jest.config.js"],
-                    stdout=open(report_file, "w"),
-                    check=True
-                )
+                with open(report_file, "w") as f:
+                    subprocess.run(
+                        ["jest", "--coverage", "--config=path/to/jest.config.js"],
+                        stdout=f,
+                        check=True
+                    )
             elif language == "C++":
                 # Implement coverage report generation for C++ using Google Test and gcov
                 pass  # Placeholder for C++ coverage
@@ -185,12 +297,16 @@ class TestGenerator:
                 # Implement coverage report generation for C# using NUnit and coverlet
                 pass  # Placeholder for C# coverage
             elif language == "Go":
+                # Test output (including --- FAIL lines) goes straight to our stdout;
+                # stderr is captured so build errors can be logged
                 subprocess.run(
                     ["go", "test", "-coverprofile=coverage.out", str(test_file)],
+                    stderr=subprocess.PIPE,
                     check=True
                 )
                 subprocess.run(
                     ["go", "tool", "cover", "-html=coverage.out", "-o", str(report_file)],
+                    stderr=subprocess.PIPE,
                     check=True
                 )
             else:
@@ -200,23 +316,78 @@ class TestGenerator:
 
         except subprocess.CalledProcessError as e:
             logging.error(f"Error generating coverage report for {test_file}: {e}")
+            if e.stderr:
+                logging.error(e.stderr.decode(errors='ignore'))
+        except Exception as e:
+            logging.error(f"Error generating coverage report for {test_file}: {e}")
+
+    def _purge_repo_modules(self, saved_modules: dict):
+        """Drop repository modules imported since saved_modules was taken.
+
+        Third-party modules are left loaded, since C extensions often cannot
+        be initialised twice in one process.
+        """
+        repo_root = os.path.dirname(os.path.abspath(__file__)) + os.sep
+        for name, module in list(sys.modules.items()):
+            if saved_modules.get(name) is module:
+                continue
+            module_file = os.path.abspath(getattr(module, '__file__', None) or os.devnull)
+            if module_file.startswith(repo_root) and 'site-packages' not in module_file:
+                if name in saved_modules:
+                    sys.modules[name] = saved_modules[name]
+                else:
+                    del sys.modules[name]
+
+    def _run_python_coverage(self, test_file: Path, report_file: Path):
+        """Run a Python test file under coverage in-process and write the report."""
+        # Imported lazily since ensure_coverage_installed may install it at runtime
+        import coverage
+
+        # Snapshot interpreter state so each test file runs as if in a fresh process
+        saved_cwd = os.getcwd()
+        saved_path = list(sys.path)
+        saved_modules = dict(sys.modules)
+
+        cov = coverage.Coverage(omit=['*/site-packages/*'])
+        cov.start()
+        try:
+            runpy.run_path(str(test_file), run_name='__main__')
+        except KeyboardInterrupt:
+            raise
+        except BaseException as e:
+            # SystemExit, pytest's Skipped etc. must not take down the generator
+            if not isinstance(e, SystemExit):
+                logging.warning(f"Test file {test_file} raised {type(e).__name__}: {e}")
+        finally:
+            cov.stop()
+            cov.save()
+            os.chdir(saved_cwd)
+            sys.path[:] = saved_path
+            self._purge_repo_modules(saved_modules)
+
+        with open(report_file, 'w') as f:
+            cov.report(show_missing=True, file=f)
 
     def ensure_coverage_installed(self, language: str):
         """
         Ensures that the appropriate coverage tool for the given programming language is installed.
         Logs messages for each step.
         """
+        if language in self._coverage_checked:
+            return
+        self._coverage_checked.add(language)
+
         try:
             if language.lower() == 'python':
-                subprocess.check_call([sys.executable, '-m', 'pip', 'show', 'coverage'])
+                subprocess.run([sys.executable, '-m', 'pip', 'show', 'coverage'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
                 logging.info("Coverage tool for Python is already installed.")
             elif language.lower() == 'javascript':
-                subprocess.check_call(['npm', 'list', 'jest'])
+                subprocess.run(['npm', 'list', 'jest'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
                 logging.info("Coverage tool for JavaScript (jest) is already installed.")
             elif language.lower() == 'java':
                 logging.info("Ensure Jacoco is configured in your Maven/Gradle build.")
             elif language.lower() == 'ruby':
-                subprocess.check_call(['gem', 'list', 'simplecov'])
+                subprocess.run(['gem', 'list', 'simplecov'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
                 logging.info("Coverage tool for Ruby (simplecov) is already installed.")
             elif language.lower() == 'go':
                 logging.info("Go coverage is handled by the 'go test' command.")
@@ -241,6 +412,20 @@ class TestGenerator:
             except subprocess.CalledProcessError:
                 logging.error(f"Failed to install the coverage tool for {language}. Please install it manually.")
 
+    def _condense_related_content(self, content: str) -> str:
+        """Strip comment and blank lines and cap the number of lines kept."""
+        lines = self._COMMENT_LINE_RE.sub('', content).splitlines()
+        return '\n'.join(lines[:self._RELATED_FILE_MAX_LINES])
+
+    def _read_related_file(self, path: str) -> Optional[str]:
+        """Read the capped, condensed excerpt of a related file."""
+        try:
+            with open(path, 'r') as rf:
+                return self._condense_related_content(rf.read(self._RELATED_FILE_MAX_CHARS))
+        except Exception as e:
+            logging.error(f"Error reading related file {path}: {e}")
+            return None
+
     def create_prompt(self, file_name: str, language: str) -> Optional[str]:
         """Create a language-specific prompt for test generation with accurate module and import names in related content."""
         try:
@@ -258,17 +443,6 @@ class TestGenerator:
         else:
             logging.info(f"No related files found for {file_name} to reference")
 
-        for related_file in related_files:
-            try:
-                with open(related_file, 'r') as rf:
-                    file_content = rf.read()
-                    module_path = str(Path(related_file).with_suffix('')).replace('/', '.')
-                    import_statement = f"import {module_path}"
-                    related_content += f"\n\n// Module: {module_path}\n{import_statement}\n{file_content}"
-                    logging.info(f"Included content from related file: {related_file} as module {module_path}")
-            except Exception as e:
-                logging.error(f"Error reading related file {related_file}: {e}")
-
         related_test_files = self.get_related_test_files(language, file_name)
         related_test_content = ""
 
@@ -277,14 +451,26 @@ class TestGenerator:
         else:
             logging.info(f"No related test files found for {file_name} to reference")
 
+        # The reads are independent, so overlap them in a thread pool
+        all_paths = related_files + related_test_files
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            contents = dict(zip(all_paths, executor.map(self._read_related_file, all_paths)))
+
+        for related_file in related_files:
+            file_content = contents[related_file]
+            if file_content is None:
+                continue
+            module_path = str(Path(related_file).with_suffix('')).replace('/', '.')
+            import_statement = f"import {module_path}"
+            related_content += f"\n\n// Module: {module_path}\n{import_statement}\n{file_content}"
+            logging.info(f"Included content from related file: {related_file} as module {module_path}")
+
         for related_test_file in related_test_files:
-            try:
-                with open(related_test_file, 'r') as rf:
-                    file_content = rf.read()
-                    related_test_content += f"\n\n// Related test file: {related_test_file}\n{file_content}"
-                    logging.info(f"Included content from related test file: {related_test_file}")
-            except Exception as e:
-                logging.error(f"Error reading related test file {related_test_file}: {e}")
+            file_content = contents[related_test_file]
+            if file_content is None:
+                continue
+            related_test_content += f"\n\n// Related test file: {related_test_file}\n{file_content}"
+            logging.info(f"Included content from related test file: {related_test_file}")
 
         framework = self.get_test_framework(language)
         prompt = f"""Generate comprehensive unit tests for the following {language} file: {file_name} using {framework}.
@@ -315,14 +501,16 @@ Generate only the test code without any explanations or notes."""
         logging.info(f"Created prompt for {file_name} with length {len(prompt)} characters")
         return prompt
 
-    def call_openai_api(self, prompt: str) -> Optional[str]:
-        """Call OpenAI API to generate test cases."""
-        headers = {
+    def _build_headers(self) -> dict:
+        """Build the HTTP headers for OpenAI API requests."""
+        return {
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {self.api_key}'
         }
-        
-        data = {
+
+    def _build_request_data(self, prompt: str, max_tokens: Optional[int] = None) -> dict:
+        """Build the chat completion request body for a prompt."""
+        return {
             'model': self.model,
             'messages': [
                 {
@@ -334,33 +522,226 @@ Generate only the test code without any explanations or notes."""
                     "content": prompt
                 }
             ],
-            'max_tokens': self.max_tokens,
-            'temperature': 0.7
+            'max_tokens': max_tokens or self.max_tokens,
+            'temperature': 0.7,
+            'stream': True
         }
 
+    def _parse_stream_line(self, line: str) -> Optional[str]:
+        """Extract the content delta from one server-sent event line."""
+        if not line.startswith('data:'):
+            return None
+        payload = line[len('data:'):].strip()
+        if not payload or payload == '[DONE]':
+            return None
+        choices = json.loads(payload).get('choices') or []
+        if not choices:
+            return None
+        return choices[0].get('delta', {}).get('content')
+
+    def _normalize_response(self, generated_text: str) -> str:
+        """Normalize quotes and strip markdown code fences from generated text."""
+        normalized_text = generated_text.translate(_QUOTE_TRANS)
+        if normalized_text.startswith('```'):
+            first_newline_index = normalized_text.find('\n', 3)
+            if first_newline_index != -1:
+                normalized_text = normalized_text[first_newline_index+1:]
+            else:
+                normalized_text = normalized_text[3:]
+            if normalized_text.endswith('```'):
+                normalized_text = normalized_text[:-3]
+        return normalized_text.strip()
+
+    def _retry_delay(self, response: httpx.Response, attempt: int) -> Optional[float]:
+        """Return how long to wait before retrying a rate-limited request, or None to give up."""
+        if response.status_code != 429 or attempt >= self._MAX_RETRIES:
+            return None
+        try:
+            return float(response.headers.get('retry-after'))
+        except (TypeError, ValueError):
+            return float(2 ** attempt)
+
+    def call_openai_api(self, prompt: str, max_tokens: Optional[int] = None) -> Optional[str]:
+        """Call OpenAI API to generate test cases."""
+        try:
+            for attempt in range(self._MAX_RETRIES + 1):
+                with self._http.stream(
+                    'POST',
+                    'https://api.openai.com/v1/chat/completions',
+                    json=self._build_request_data(prompt, max_tokens)
+                ) as response:
+                    delay = self._retry_delay(response, attempt)
+                    if delay is None:
+                        response.raise_for_status()
+                        chunks = []
+                        for line in response.iter_lines():
+                            content = self._parse_stream_line(line)
+                            if content:
+                                chunks.append(content)
+                        # Code fences only appear at the ends, so strip them once complete
+                        return self._normalize_response(''.join(chunks))
+                logging.warning(f"Rate limited by OpenAI API; retrying in {delay:.1f}s")
+                time.sleep(delay)
+        except (httpx.HTTPError, ValueError) as e:
+            # ValueError covers malformed JSON in the event stream
+            logging.error(f"API request failed: {e}")
+            return None
+
+    def _estimate_tokens(self, text: str) -> int:
+        """Cheaply estimate the token count of a prompt."""
+        return len(text) // 4
+
+    def _build_batch_prompt(self, prompts: List[str], file_names: Optional[List[str]] = None) -> str:
+        """Combine several prompts into one request asking for labeled test blocks."""
+        if file_names is None:
+            file_names = [f"file_{i}" for i in range(1, len(prompts) + 1)]
+        sections = [
+            f"You will receive {len(prompts)} independent test generation tasks. "
+            f"For each task i, respond with a line '### TEST i' followed by only the test code for that task."
+        ]
+        for i, (file_name, prompt) in enumerate(zip(file_names, prompts), start=1):
+            sections.append(f"### FILE {i}: {file_name}\n\n{prompt}")
+        return "\n\n".join(sections)
+
+    def _max_output_tokens(self) -> int:
+        """Return the output token ceiling of the configured model."""
+        for prefix in sorted(self._MODEL_MAX_OUTPUT_TOKENS, key=len, reverse=True):
+            if self.model.startswith(prefix):
+                return self._MODEL_MAX_OUTPUT_TOKENS[prefix]
+        return self._DEFAULT_MAX_OUTPUT_TOKENS
+
+    def _max_batch_size(self) -> int:
+        """Return how many files fit in one request without exceeding the output ceiling."""
+        return max(1, min(self._MAX_BATCH_SIZE, self._max_output_tokens() // self.max_tokens))
+
+    def _split_batch_response(self, generated_text: Optional[str], count: int) -> List[Optional[str]]:
+        """Split a batched completion back into per-file test code."""
+        if not generated_text:
+            return [None] * count
+        # Models often wrap the whole answer in one code fence; drop it before splitting
+        generated_text = self._normalize_response(generated_text)
+        parts = self._BATCH_TEST_RE.split(generated_text)
+        tests = {}
+        for index, body in zip(parts[1::2], parts[2::2]):
+            tests[int(index)] = self._normalize_response(body.strip()) or None
+        return [tests.get(i) for i in range(1, count + 1)]
+
+    async def _generate_batch(
+        self,
+        send: Callable[[str, Optional[int]], Awaitable[Optional[str]]],
+        prompts: List[str],
+        file_names: Optional[List[str]] = None
+    ) -> List[Optional[str]]:
+        """Generate test cases for several prompts with one request, re-sending any file left out.
+
+        ``send(prompt, max_tokens)`` performs a single API call, so the same
+        batching and retry logic serves both the sync and the async client.
+        """
+        if len(prompts) == 1:
+            return [await send(prompts[0], None)]
         try:
-            response = requests.post(
-                'https://api.openai.com/v1/chat/completions',
-                headers=headers,
-                json=data,
-                timeout=60
+            generated_text = await send(
+                self._build_batch_prompt(prompts, file_names),
+                self.max_tokens * len(prompts)
             )
-            response.raise_for_status()
-            generated_text = response.json()['choices'][0]['message']['content']
-            normalized_text = generated_text.replace('“', '"').replace('”', '"').replace("‘", "'").replace("’", "'")
-            if normalized_text.startswith('```'):
-                first_newline_index = normalized_text.find('\n', 3)
-                if first_newline_index != -1:
-                    normalized_text = normalized_text[first_newline_index+1:]
-                else:
-                    normalized_text = normalized_text[3:]
-                if normalized_text.endswith('```'):
-                    normalized_text = normalized_text[:-3]
-            return normalized_text.strip()
-        except RequestException as e:
+        except Exception as e:
+            logging.error(f"Batched API request failed: {e}")
+            generated_text = None
+        results = self._split_batch_response(generated_text, len(prompts))
+
+        # Re-send any file whose block is missing from the batched answer
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            retries = await asyncio.gather(*(send(prompts[i], None) for i in missing))
+            for i, result in zip(missing, retries):
+                results[i] = result
+        return results
+
+    def batch_call_openai_api(self, prompts: List[str], file_names: Optional[List[str]] = None) -> List[Optional[str]]:
+        """Call OpenAI API once to generate test cases for several prompts."""
+        async def send(prompt: str, max_tokens: Optional[int]) -> Optional[str]:
+            return self.call_openai_api(prompt, max_tokens)
+
+        return asyncio.run(self._generate_batch(send, prompts, file_names))
+
+    def _group_batches(self, jobs: List[Tuple[str, str, str]]) -> List[List[Tuple[str, str, str]]]:
+        """Group consecutive jobs into batches that fit the prompt token budget."""
+        budget = self.max_tokens * 3
+        max_batch_size = self._max_batch_size()
+        batches = []
+        current = []
+        current_tokens = 0
+        for job in jobs:
+            tokens = self._estimate_tokens(job[2])
+            if current and (current_tokens + tokens > budget or len(current) >= max_batch_size):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(job)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _acall_openai(
+        self,
+        client: httpx.AsyncClient,
+        semaphore: asyncio.Semaphore,
+        prompt: str,
+        max_tokens: Optional[int] = None
+    ) -> Optional[str]:
+        """Call OpenAI API asynchronously to generate test cases."""
+        try:
+            for attempt in range(self._MAX_RETRIES + 1):
+                async with semaphore:
+                    async with client.stream(
+                        'POST',
+                        'https://api.openai.com/v1/chat/completions',
+                        json=self._build_request_data(prompt, max_tokens)
+                    ) as response:
+                        delay = self._retry_delay(response, attempt)
+                        if delay is None:
+                            response.raise_for_status()
+                            chunks = []
+                            async for line in response.aiter_lines():
+                                content = self._parse_stream_line(line)
+                                if content:
+                                    chunks.append(content)
+                            return self._normalize_response(''.join(chunks))
+                # Back off outside the semaphore so other requests can proceed
+                logging.warning(f"Rate limited by OpenAI API; retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        except (httpx.HTTPError, ValueError) as e:
+            # ValueError covers malformed JSON in the event stream
             logging.error(f"API request failed: {e}")
             return None
-        
+
+    async def _dispatch(self, batches: List[List[Tuple[str, str, str]]]) -> list:
+        """Send all batches concurrently over a single shared HTTP client."""
+        # HTTP/2 multiplexes every request over one connection, so bound concurrency here
+        semaphore = asyncio.Semaphore(self._MAX_CONCURRENT_REQUESTS)
+        limits = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+        async with httpx.AsyncClient(
+            http2=True, timeout=60, limits=limits, headers=self._build_headers()
+        ) as client:
+            send = functools.partial(self._acall_openai, client, semaphore)
+            outcomes = await asyncio.gather(
+                *(
+                    self._generate_batch(send, [job[2] for job in batch], [job[0] for job in batch])
+                    for batch in batches
+                ),
+                return_exceptions=True
+            )
+
+        # Flatten back to one result per job, in job order
+        results = []
+        for batch, outcome in zip(batches, outcomes):
+            if isinstance(outcome, Exception):
+                results.extend([outcome] * len(batch))
+            else:
+                results.extend(outcome)
+        return results
+
     def save_test_cases(self, file_name: str, test_cases: str, language: str) -> Optional[Path]:
         """Save generated test cases to appropriate directory structure."""
         tests_dir = Path('generated_tests')
@@ -413,6 +794,11 @@ Generate only the test code without any explanations or notes."""
             logging.error(f"File {test_file} was not created.")
             return None
 
+    def _is_test_file(self, file_name: str) -> bool:
+        """Check whether a file is itself a test, e.g. a previously generated one."""
+        name = Path(file_name).name
+        return name.startswith('test_') or name.endswith(self._TEST_FILE_SUFFIXES)
+
     def run(self):
         """Main execution method."""
         changed_files = self.get_changed_files()
@@ -420,37 +806,75 @@ Generate only the test code without any explanations or notes."""
             logging.info("No files changed.")
             return
 
+        jobs = []
+        warm_up_started = False
         for file_name in changed_files:
             if file_name == "generate_tests.py":
                 continue  # Skip the test generation script itself
+            if self._is_test_file(file_name):
+                logging.info(f"Skipping test file: {file_name}")
+                continue
             try:
                 language = self.detect_language(file_name)
                 if language == 'Unknown':
                     logging.warning(f"Unsupported file type: {file_name}")
                     continue
 
+                if not warm_up_started:
+                    # Pay DNS + TCP + TLS setup in the background while prompts are built
+                    threading.Thread(target=self._warm_up_connection, daemon=True).start()
+                    warm_up_started = True
+
                 logging.info(f"Processing {file_name} ({language})")
                 prompt = self.create_prompt(file_name, language)
-                
+
                 if prompt:
-                    test_cases = self.call_openai_api(prompt)
-                    
-                    if test_cases:
-                        test_cases = test_cases.replace("“", '"').replace("”", '"')
-                        self.ensure_coverage_installed(language)
-
-                        test_file = self.save_test_cases(file_name, test_cases, language)
-                        if test_file:
-                            self.generate_coverage_report(test_file, language)
-                    else:
-                        logging.error(f"Failed to generate test cases for {file_name}")
+                    jobs.append((file_name, language, prompt))
+            except Exception as e:
+                logging.error(f"Error processing {file_name}: {e}")
+
+        if not jobs:
+            return
+
+        # Pack small prompts together and send the batches concurrently
+        batches = self._group_batches(jobs)
+        if len(batches) == 1:
+            # A single request reuses the connection warmed up above
+            batch = batches[0]
+            try:
+                results = self.batch_call_openai_api([job[2] for job in batch], [job[0] for job in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+        else:
+            results = asyncio.run(self._dispatch(batches))
+
+        # A broken toolchain only skips coverage for its own language
+        coverage_ready = set()
+        for language in {language for _, language, _ in jobs}:
+            try:
+                self.ensure_coverage_installed(language)
+                coverage_ready.add(language)
+            except Exception as e:
+                logging.error(f"Error checking coverage tool for {language}: {e}")
+
+        for (file_name, language, _), test_cases in zip(jobs, results):
+            try:
+                if isinstance(test_cases, Exception):
+                    raise test_cases
+
+                if test_cases:
+                    test_file = self.save_test_cases(file_name, test_cases, language)
+                    if test_file and language in coverage_ready:
+                        self.generate_coverage_report(test_file, language)
+                else:
+                    logging.error(f"Failed to generate test cases for {file_name}")
             except Exception as e:
                 logging.error(f"Error processing {file_name}: {e}")
 
 if __name__ == '__main__':
     try:
-        generator = TestGenerator()
-        generator.run()
+        with TestGenerator() as generator:
+            generator.run()
     except Exception as e:
         logging.error(f"Fatal error: {e}")
         sys.exit(1)